@@ -8,6 +8,8 @@ import pandas as pd
 import requests
 from tqdm import tqdm
 from config import *
+from kline_store import latest_candle_time
+from quality_index import quality_rows, update_quality_index
 import random
 from pathlib import Path
 
@@ -137,6 +139,7 @@ def main_download(urls, directory, proxies):
     error_urls = []
     success_urls = []
     retryed_urls = []
+    missing_urls = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=下载线程数) as executor:
         future_to_url = {executor.submit(download_url, url, directory, proxies): url for url in urls}
         for future in concurrent.futures.as_completed(future_to_url):
@@ -150,7 +153,22 @@ def main_download(urls, directory, proxies):
                 success_urls.append(url)
             elif result == 0:
                 success_urls.append(url)
-    return error_urls, retryed_urls, success_urls
+            elif result == -1:
+                missing_urls.append(url)
+    return error_urls, retryed_urls, success_urls, missing_urls
+
+
+def file_time_range(filename):
+    """
+    根据zip文件名计算其覆盖的时间区间，如 BTCUSDT-1m-2024-01.zip 为整月，BTCUSDT-1m-2024-01-15.zip 为单日
+    """
+    date_parts = [int(part) for part in filename.split('.zip')[0].split('-')[2:]]
+    if len(date_parts) == 3:
+        range_start = datetime(*date_parts)
+        return range_start, range_start + timedelta(days=1)
+    year, month = date_parts
+    range_end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return datetime(year, month, 1), range_end
 
 
 def verify_checksum(zip_file_path, checksum_file_path):
@@ -190,13 +208,7 @@ def all_merge_csv(folder_path):
     return merge_files_list
 
 
-if __name__ == '__main__':
-    # 默认值
-    target = 'spot'
-    # 检查是否有足够的命令行参数
-    if len(sys.argv) > 1:
-        target = sys.argv[1]
-
+def main(target):
     # 你可以在这里根据target的值进行相应的操作
     if target == "spot":
         download_directory = 现货临时下载文件夹
@@ -210,6 +222,8 @@ if __name__ == '__main__':
         mode = "合约"
     checksum_directory = os.path.join(download_directory, 'checksums')
     os.makedirs(checksum_directory, exist_ok=True)
+    quality_directory = os.path.join(download_directory, 'quality')
+    os.makedirs(quality_directory, exist_ok=True)
     # 设置增量zip文件下载目录
     failed_symbols_log = os.path.join(main_path,  f'{mode}_Download_failed_log.txt')
     retryed_symbols_log = os.path.join(main_path,  f'{mode}_Download_retryed_log.txt')
@@ -220,17 +234,15 @@ if __name__ == '__main__':
     symbols = get_all_symbols(proxies, target)  # 下载全部币种,包括现在已经下架的
     # 读取CSV文件，获取最新的candle_begin_time日期
     csv_path = os.path.join(data_directory, 'ZEN-USDT.csv')
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path, skiprows=1, encoding='GBK')
-        latest_date_str = df['candle_begin_time'].max()
-        latest_date = datetime.strptime(latest_date_str, '%Y-%m-%d %H:%M:%S')
+    latest_date = latest_candle_time(csv_path)
+    if latest_date is not None:
         print(f'币安在交易的{target}USDT交易对币种总数:', len(symbols))
     else:
         latest_date = datetime(2017, 9, 3)
         # 生成币种列表
 
     if len(symbols) < 1:
-        exit()
+        return
 
     print(f'币安全部{mode}USDT交易对币种个数:', len(symbols))
     symbols = [symbol for symbol in symbols if not any(keyword in symbol for keyword in ['UP', 'DOWN', 'BEAR', 'BULL'])]
@@ -313,9 +325,9 @@ if __name__ == '__main__':
         checksum_urls.sort()
 
         # 下载失败的url列表
-        failed_symbols, retryed_symbols, success_symbol_urls = main_download(urls, download_directory, proxies)
+        failed_symbols, retryed_symbols, success_symbol_urls, missing_symbol_urls = main_download(urls, download_directory, proxies)
         # 下载失败的CHECKSUM文件的url列表
-        failed_checksums, retryed_checksums, success_checksums = main_download(checksum_urls, checksum_directory, proxies)
+        failed_checksums, retryed_checksums, success_checksums, missing_checksums = main_download(checksum_urls, checksum_directory, proxies)
 
         # 初始化用于跟踪每个币种失败次数的字典
         if len(failed_symbols) > 0:
@@ -327,6 +339,9 @@ if __name__ == '__main__':
                 for i in retryed_symbols:
                     f.write(f'{i}\n')
 
+        # 记录币安上不存在的文件和校验重试次数，供清洗时写入该币种的数据质量索引
+        missing_ranges = [file_time_range(url.split('/')[-1]) for url in missing_symbol_urls]
+        checksum_retries = []
         for url in success_symbol_urls:
             filename = url.split('/')[-1]
             zip_file_path = os.path.join(download_directory, filename)
@@ -341,9 +356,6 @@ if __name__ == '__main__':
                     valid = verify_checksum(zip_file_path, checksum_file_path)
 
                     if not valid:
-                        # 如果校验失败，记录该币种的失败次数
-                        symbol = filename.split('_')[0]
-
                         # 删除原有文件，以便重新下载
                         os.remove(zip_file_path)
                         os.remove(checksum_file_path)
@@ -357,6 +369,16 @@ if __name__ == '__main__':
             if attempts > 1:  # 等于1时，代表经过一次校验即通过
                 with open(Verify_times_log, 'a') as f:  # 使用追加模式'a'
                     f.write(f"{symbol}: {filename}, 校验重试次数: {attempts - 1}\n")
+                checksum_retries.append((*file_time_range(filename), attempts - 1))
+
+        update_quality_index(
+            os.path.join(quality_directory, f'{symbol}.csv'),
+            pd.concat([
+                quality_rows([r[0] for r in missing_ranges], [r[1] for r in missing_ranges], 'missing_file', 1),
+                quality_rows([r[0] for r in checksum_retries], [r[1] for r in checksum_retries], 'checksum_retry',
+                             [r[2] for r in checksum_retries]),
+            ], ignore_index=True),
+            replace_items=('missing_file', 'checksum_retry'))
 
         matching_files = list(Path(download_directory).glob(f"*{symbol}*.zip"))
         num_matching_files = len(matching_files)
@@ -367,3 +389,12 @@ if __name__ == '__main__':
 
     pbar.close()
 
+
+if __name__ == '__main__':
+    # 默认值
+    target = 'spot'
+    # 检查是否有足够的命令行参数
+    if len(sys.argv) > 1:
+        target = sys.argv[1]
+
+    main(target)
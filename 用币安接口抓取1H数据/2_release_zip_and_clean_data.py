@@ -5,17 +5,20 @@ import zipfile
 from glob import glob
 from itertools import product
 from pathlib import Path
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
 from joblib import Parallel, delayed
 from tqdm import tqdm
 from config import *
+from quality_index import quality_rows, update_quality_index
 
 pd.set_option('display.max_rows', 1000)
 pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
 
 
 # 通过所有zip文件的文件名前缀获取币种名称列表
-def extract_coin_names(folder_path):
+def extract_coin_names(folder_path, mode):
     zip_files = glob(os.path.join(folder_path, '*.zip'))
     print(f'发现 {len(zip_files)} 个{mode}zip 文件.')
     time.sleep(1)
@@ -105,6 +108,55 @@ def process_single_file(file):
     return df
 
 
+def fill_minute_gaps(df):
+    """
+    按整数分钟偏移补齐缺失的1分钟K线，并统计缺口
+    :param df: 已按 candle_begin_time 排序去重的1分钟K线
+    :return: 补齐后的K线(is_filled列标记补出来的分钟), 缺口表(gap_start缺口起点, minutes缺口长度)
+    """
+    start_date = df['candle_begin_time'].iloc[0]
+    # 相对起点的分钟偏移，不在整分钟上的数据与原先按date_range合并时一样被丢弃
+    offsets, remainders = np.divmod((df['candle_begin_time'] - start_date).values.astype(np.int64), 60 * 10 ** 9)
+    on_minute = remainders == 0
+    offsets = offsets[on_minute]
+    total = int(offsets[-1]) + 1
+
+    present = np.zeros(total, dtype=bool)
+    present[offsets] = True
+    columns = {}
+    for column in ['open', 'high', 'low', 'close', 'volume', 'quote_volume', 'trade_num',
+                   'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']:
+        values = np.full(total, np.nan)
+        values[offsets] = df[column].values[on_minute]
+        columns[column] = values
+
+    # close 向前填充：记录每个位置之前最近一个有效值的下标，再一次性取值
+    close = columns['close']
+    last_valid = np.where(np.isnan(close), 0, np.arange(total))
+    np.maximum.accumulate(last_valid, out=last_valid)
+    columns['close'] = close[last_valid]
+    for column in ['open', 'high', 'low']:
+        columns[column] = np.where(np.isnan(columns[column]), columns['close'], columns[column])
+    for column in ['volume', 'quote_volume', 'trade_num', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']:
+        columns[column] = np.nan_to_num(columns[column], nan=0.0)
+
+    filled_df = pd.DataFrame(columns)
+    filled_df.insert(0, 'candle_begin_time', pd.date_range(start=start_date, periods=total, freq='1T'))
+    filled_df['symbol'] = df['symbol'].iloc[0]
+    filled_df['is_filled'] = ~present
+
+    # 统计连续缺口的起点和长度
+    edges = np.diff(np.concatenate(([0], (~present).astype(np.int8), [0])))
+    gap_starts = np.flatnonzero(edges == 1)
+    gap_ends = np.flatnonzero(edges == -1)
+    gaps = pd.DataFrame({
+        'gap_start': start_date + pd.to_timedelta(gap_starts, unit='min'),
+        'minutes': gap_ends - gap_starts,
+    })
+
+    return filled_df, gaps
+
+
 def process_coin_files(files):
     dataframes = Parallel(n_jobs=max(os.cpu_count() - 1, 1))(
         delayed(process_single_file)(file) for file in files
@@ -112,21 +164,13 @@ def process_coin_files(files):
     merged_df = pd.concat(dataframes)
 
     merged_df.sort_values(by='candle_begin_time', inplace=True)
+    # 统计每小时被去掉的重复分钟数
+    duplicated = merged_df.duplicated(subset=['candle_begin_time'], keep='last')
+    duplicate_hours = merged_df.loc[duplicated, 'candle_begin_time'].dt.floor('H').value_counts().sort_index()
     merged_df.drop_duplicates(subset=['candle_begin_time'], inplace=True, keep='last')
     merged_df.reset_index(drop=True, inplace=True)
     # 填充空缺的数据
-    start_date = merged_df.iloc[0]['candle_begin_time']
-    end_date = merged_df.iloc[-1]['candle_begin_time']
-    benchmark = pd.DataFrame(pd.date_range(start=start_date, end=end_date, freq='1T'))  # 创建开始至回测结束时间的1H列表
-    benchmark.rename(columns={0: 'candle_begin_time'}, inplace=True)
-    merged_df = pd.merge(left=benchmark, right=merged_df, on='candle_begin_time', how='left', sort=True, indicator=True)
-    merged_df['close'] = merged_df['close'].fillna(method='ffill')
-    merged_df['symbol'] = merged_df['symbol'].fillna(method='ffill')
-    for column in ['open', 'high', 'low']:
-        merged_df[column] = merged_df[column].fillna(merged_df['close'])
-    _ = ['volume', 'quote_volume', 'trade_num', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume']
-    merged_df[_] = merged_df[_].fillna(0)
-    # merged_df = merged_df[merged_df['_merge'] == 'left_only']
+    merged_df, gaps = fill_minute_gaps(merged_df)
 
     # 将索引转换为DatetimeIndex，如果它还不是
     merged_df.set_index('candle_begin_time', inplace=True)
@@ -154,7 +198,15 @@ def process_coin_files(files):
     })
     hourly_df.reset_index(inplace=True)
 
-    return hourly_df
+    # 每小时由向前填充补出来的分钟数，用于区分缺数据造成的零成交和真实的零成交
+    filled_hours = merged_df['is_filled'].resample('1H').sum()
+    filled_hours = filled_hours[filled_hours > 0]
+    quality = pd.concat([
+        quality_rows(filled_hours.index, filled_hours.index + pd.Timedelta(hours=1), 'filled_minutes', filled_hours.values),
+        quality_rows(duplicate_hours.index, duplicate_hours.index + pd.Timedelta(hours=1), 'duplicates', duplicate_hours.values),
+    ], ignore_index=True)
+
+    return hourly_df, gaps, quality
 
 
 def find_trigger_index(goals, prices_list, trigger_type):
@@ -215,13 +267,58 @@ def process_single_combination(df, stop_profit, stop_loss):
     return _[f'stop[{stop_profit}_{stop_loss}]']
 
 
-def process_stop(df, stop_loss_list, stop_profit_list, n_jobs=-1):
+def stop_price_windows(df):
+    """
+    与 process_single_combination 中的 high_list/low_list 对应：每行未来24小时的最高价、最低价，
+    第25列为 index+24 的 avg_price_1m，超出数据末尾的位置为NaN(与任何价格比较都不触发)
+    :return: 最高价窗口, 最低价窗口，形状均为 (行数, 25)
+    """
+    n = len(df)
+    padding = np.full(24, np.nan)
+    extra_prices = np.full((n, 1), np.nan)
+    extra_prices[:max(n - 24, 0), 0] = df['avg_price_1m'].values[24:]
+    high_windows = sliding_window_view(np.concatenate([df['high'].values.astype(float), padding]), 24)[:n]
+    low_windows = sliding_window_view(np.concatenate([df['low'].values.astype(float), padding]), 24)[:n]
+    return np.hstack([high_windows, extra_prices]), np.hstack([low_windows, extra_prices])
+
+
+def process_single_combination_numpy(df, stop_profit, stop_loss, windows=None):
+    """
+    process_single_combination 的向量化实现，结果逐位一致，用 benchmark_stop.py 校验
+    :param windows: stop_price_windows 的结果，多个止盈止损组合共用时可事先算好传入
+    """
+    high_windows, low_windows = stop_price_windows(df) if windows is None else windows
+    avg_price = df['avg_price_1m'].values
+    profit_hits = (avg_price * (1 + stop_profit))[:, None] < high_windows
+    loss_hits = (avg_price * (1 + stop_loss))[:, None] > low_windows
+    # 第一个触发的位置，没有触发为inf
+    profit_trigger = np.where(profit_hits.any(axis=1), profit_hits.argmax(axis=1), np.inf)
+    loss_trigger = np.where(loss_hits.any(axis=1), loss_hits.argmax(axis=1), np.inf)
+    # 与 calculate_stop 的判断顺序一致，固定为int64，与逐行实现一致(Windows上numpy默认整数为int32)
+    stop = np.select(
+        [(loss_trigger == np.inf) & (profit_trigger == np.inf), loss_trigger < profit_trigger, loss_trigger > profit_trigger],
+        [0, -1, 1],
+        2,
+    ).astype(np.int64)
+    return pd.Series(stop, index=df.index, name=f'stop[{stop_profit}_{stop_loss}]')
+
+
+def process_stop(df, stop_loss_list, stop_profit_list, n_jobs=-1, engine=None):
+    """
+    :param engine: 'numpy' 为向量化实现，'iterrows' 为逐行实现，默认取 config 中的 stop_engine
+    """
     if not calc_stop:
         return df
     # print(f'开始计算{coin_name}止盈止损状态数据')
     stop_all_list = list(product(stop_profit_list, stop_loss_list))
-    results_dfs = Parallel(n_jobs=n_jobs)(
-        delayed(process_single_combination)(df, stop_profit, stop_loss) for stop_profit, stop_loss in stop_all_list)
+    if (engine or stop_engine) == 'numpy':
+        # 各组合共用同一份价格窗口，在当前进程中依次计算即可
+        windows = stop_price_windows(df)
+        results_dfs = [process_single_combination_numpy(df, stop_profit, stop_loss, windows)
+                       for stop_profit, stop_loss in stop_all_list]
+    else:
+        results_dfs = Parallel(n_jobs=n_jobs)(
+            delayed(process_single_combination)(df, stop_profit, stop_loss) for stop_profit, stop_loss in stop_all_list)
     results_combined = pd.concat(results_dfs, axis=1)
     # 合并结果
     df_final = pd.concat([df, results_combined], axis=1)
@@ -229,7 +326,7 @@ def process_stop(df, stop_loss_list, stop_profit_list, n_jobs=-1):
     return df_final
 
 
-def get_merge_csv_files(folder_path):
+def get_merge_csv_files(folder_path, gap_log=None):
     csv_files = glob(os.path.join(folder_path, '*.csv'))
 
     grouped_files = {}
@@ -242,9 +339,22 @@ def get_merge_csv_files(folder_path):
 
         grouped_files.setdefault(coin_name, []).append(file)
 
+    quality_directory = os.path.join(folder_path, 'quality')
+    os.makedirs(quality_directory, exist_ok=True)
+
     for coin_name, files in grouped_files.items():
         try:
-            hourly_df = process_coin_files(files)
+            hourly_df, gaps, quality = process_coin_files(files)
+            # 记录补齐的缺口数量和长度，作为数据质量指标
+            if gap_log and len(gaps) > 0:
+                with open(gap_log, 'a') as f:
+                    f.write(f"{coin_name}: 缺口{len(gaps)}个, 共补齐{gaps['minutes'].sum()}分钟, "
+                            f"最长缺口{gaps['minutes'].max()}分钟({gaps.loc[gaps['minutes'].idxmax(), 'gap_start']})\n")
+            # 与下载时记录的缺失文件、校验重试合并为该币种的质量索引，上币前和下架后的缺失文件不计入
+            update_quality_index(os.path.join(quality_directory, f'{coin_name}.csv'), quality,
+                                 replace_items=('filled_minutes', 'duplicates'),
+                                 span=(hourly_df['candle_begin_time'].iloc[0],
+                                       hourly_df['candle_begin_time'].iloc[-1] + pd.Timedelta(hours=1)))
 
             df_final = process_stop(hourly_df, stop_loss_list, stop_profit_list)
 
@@ -265,20 +375,16 @@ def delete_unmerged_csv_files(folder_path):
             os.remove(csv_file)  # 删除文件
 
 
-if __name__ == "__main__":
-    # 默认值
-    target = 'spot'
-    # 检查是否有足够的命令行参数
-    if len(sys.argv) > 1:
-        target = sys.argv[1]
+def main(target):
     if target == "spot":
         download_directory = 现货临时下载文件夹
         mode = "现货"
     elif target == "swap":
         download_directory = 永续合约临时下载文件夹
         mode = "合约"
+    gap_log = os.path.join(main_path, f'{mode}_Gap_fill_log.txt')
 
-    coins_to_clean = extract_coin_names(download_directory)
+    coins_to_clean = extract_coin_names(download_directory, mode)
     merge_csvs = all_merge_csv(download_directory)
 
     # 如果任务中断，识别断点，继续清理
@@ -297,7 +403,7 @@ if __name__ == "__main__":
 
             # 步骤2: 清洗合并
             pbar.set_description(f"🚿 正在清洗合并{file_num}个{coin}的csv文件")
-            get_merge_csv_files(download_directory)
+            get_merge_csv_files(download_directory, gap_log)
 
             # 步骤3: 删除这个币种的一分钟CSV,完成处理
             delete_unmerged_csv_files(download_directory)
@@ -307,3 +413,12 @@ if __name__ == "__main__":
             time.sleep(1)
     pbar.close()
 
+
+if __name__ == "__main__":
+    # 默认值
+    target = 'spot'
+    # 检查是否有足够的命令行参数
+    if len(sys.argv) > 1:
+        target = sys.argv[1]
+
+    main(target)
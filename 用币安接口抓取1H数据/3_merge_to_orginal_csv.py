@@ -1,37 +1,70 @@
 # -*- coding: utf-8 -*-
+import concurrent.futures
 import sys
+import tempfile
 from glob import glob
 import pandas as pd
 from tqdm import tqdm
 from config import *
+from quality_index import read_quality_index
 
-# 默认值
-target = 'spot'
-
-# 检查是否有足够的命令行参数
-if len(sys.argv) > 1:
-    target = sys.argv[1]
-
-if target == "spot":
-    mode = '现货'
-    orginal_csv_path = 现货K线存放路径
-    download_directory = 现货临时下载文件夹
-elif target == "swap":
-    mode = '合约'
-    orginal_csv_path = 永续合约K线存放路径
-    download_directory = 永续合约临时下载文件夹
-print(f"————————————————————————————————开始更新 {mode}数据至K线数据库")
-csv_files = glob(os.path.join(download_directory, f"*{'_merge'}*.csv"))
-with tqdm(total=len(csv_files), desc="总体进度", unit=mode) as pbar:
-    for new_csv in csv_files:
-        coin_name = os.path.basename(new_csv).split('_')[0]
-        # print(f"正在处理 {coin_name} 的K线数据")
-
-        if any(keyword in coin_name for keyword in ['UP', 'DOWN', 'BEAR', 'BULL']):
-            print(f"{coin_name} 是用不到的K线数据，跳过")
-            continue
-        coin_name = coin_name.replace("USDT", "-USDT")
-        orginal_csv = os.path.join(orginal_csv_path, coin_name + '.csv')
+special_string = "本数据由喜顺有限公司整理"
+
+
+def current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def write_csv_atomic(df, csv_path, banner=special_string):
+    """
+    先写入同目录下的临时文件，写完后再替换目标文件，中途崩溃不会留下写了一半的CSV
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(csv_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='gbk', newline='') as file:
+            if banner:
+                file.write(banner + '\n')
+            df.to_csv(file, index=False)
+            # 落盘后再替换，断电也不会留下空文件或截断的文件
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp 创建的文件权限为0600，沿用原文件的权限，新文件按 umask 设置
+        os.chmod(tmp_path, os.stat(csv_path).st_mode & 0o777 if os.path.exists(csv_path) else 0o666 & ~current_umask())
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def merge_quality_index(new_quality_csv, quality_csv, start_date_new_df):
+    """
+    将清洗时生成的质量索引合并进质量索引库，与K线一样以新数据的起点为界替换旧记录
+    """
+    if not os.path.exists(new_quality_csv):
+        return
+    new_quality = read_quality_index(new_quality_csv)
+    quality = read_quality_index(quality_csv)
+    quality = quality[quality['range_start'] < pd.to_datetime(start_date_new_df)]
+    quality = pd.concat([quality, new_quality], ignore_index=True).drop_duplicates()
+    quality.sort_values(['range_start', 'item'], inplace=True)
+    write_csv_atomic(quality, quality_csv, banner=None)
+
+
+def merge_single_coin(new_csv, orginal_csv_path, quality_path):
+    """
+    将一个币种新清洗的1H数据增量合并进K线数据库
+    :return: (币种名称, 状态, 数据截止时间或错误信息, 质量索引合并的错误信息)，状态为 '更新'、'新增'、'跳过' 或 '失败'，
+             K线已更新但质量索引合并失败时状态仍为 '更新'/'新增'，错误信息记录在最后一项
+    """
+    coin_name = os.path.basename(new_csv).split('_')[0]
+    if any(keyword in coin_name for keyword in ['UP', 'DOWN', 'BEAR', 'BULL']):
+        return coin_name, '跳过', '用不到的K线数据', None
+    new_quality_csv = os.path.join(os.path.dirname(new_csv), 'quality', coin_name + '.csv')
+    coin_name = coin_name.replace("USDT", "-USDT")
+    orginal_csv = os.path.join(orginal_csv_path, coin_name + '.csv')
+    try:
         new_df = pd.read_csv(new_csv)
         # 增量更新（通过是否存在原始CSV数据判定）
         if os.path.exists(orginal_csv):
@@ -49,16 +82,92 @@ with tqdm(total=len(csv_files), desc="总体进度", unit=mode) as pbar:
             # 拼接数据
             concatenated_df = pd.concat([original_df, new_df], ignore_index=True)
             concatenated_df.sort_values('candle_begin_time', inplace=True)
+            status = '更新'
         # 首次下载,没有原始CSV数据
         else:
             concatenated_df = new_df
+            status = '新增'
         end_date_new_df = new_df['candle_begin_time'].iloc[-1]
         # 生成新的文件，如有旧的，会覆盖旧的
-        special_string = "本数据由喜顺有限公司整理"
-        with open(orginal_csv, 'w', encoding='gbk', newline='') as file:
-            file.write(special_string + '\n')
-            concatenated_df.to_csv(file, index=False)
-            pbar.set_description(f"✅ {coin_name} {mode}数据已更新至{end_date_new_df}")
+        write_csv_atomic(concatenated_df, orginal_csv)
+    except Exception as exc:
+        return coin_name, '失败', str(exc), None
+    # K线已经替换，质量索引合并失败单独报告，不影响K线的更新状态
+    try:
+        merge_quality_index(new_quality_csv, os.path.join(quality_path, coin_name + '.csv'),
+                            new_df['candle_begin_time'].iloc[0])
+    except Exception as exc:
+        return coin_name, status, end_date_new_df, str(exc)
+    return coin_name, status, end_date_new_df, None
+
+
+def main(target):
+    if target == "spot":
+        mode = '现货'
+        orginal_csv_path = 现货K线存放路径
+        quality_path = 现货质量索引路径
+        download_directory = 现货临时下载文件夹
+    elif target == "swap":
+        mode = '合约'
+        orginal_csv_path = 永续合约K线存放路径
+        quality_path = 永续合约质量索引路径
+        download_directory = 永续合约临时下载文件夹
+    os.makedirs(quality_path, exist_ok=True)
+    failed_merge_log = os.path.join(main_path, f'{mode}_Merge_failed_log.txt')
+    failed_quality_log = os.path.join(main_path, f'{mode}_Quality_merge_failed_log.txt')
+    print(f"————————————————————————————————开始更新 {mode}数据至K线数据库")
+    csv_files = glob(os.path.join(download_directory, f"*{'_merge'}*.csv"))
+
+    results = []
+    with tqdm(total=len(csv_files), desc="总体进度", unit=mode) as pbar:
+        def on_result(result):
+            coin_name, status, detail, quality_error = result
+            results.append(result)
+            if status == '失败':
+                pbar.set_description(f"❌ {coin_name} {mode}数据更新失败")
+            elif status != '跳过':
+                pbar.set_description(f"✅ {coin_name} {mode}数据已更新至{detail}")
             pbar.update(1)
-    pbar.close()
-print(f"所有{mode}数据已更新至{end_date_new_df}")
+
+        # 各币种互不依赖，可以多进程并行合并；进程数为1时在当前进程中依次合并
+        if 合并进程数 > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=合并进程数) as executor:
+                futures = [executor.submit(merge_single_coin, new_csv, orginal_csv_path, quality_path) for new_csv in csv_files]
+                for future in concurrent.futures.as_completed(futures):
+                    on_result(future.result())
+        else:
+            for new_csv in csv_files:
+                on_result(merge_single_coin(new_csv, orginal_csv_path, quality_path))
+
+    # 汇总各币种的合并结果
+    summary = {status: [r for r in results if r[1] == status] for status in ['更新', '新增', '跳过', '失败']}
+    print(f"{mode}数据合并完成: 更新{len(summary['更新'])}个, 新增{len(summary['新增'])}个, "
+          f"跳过{len(summary['跳过'])}个, 失败{len(summary['失败'])}个")
+    for coin_name, _, detail, _ in summary['跳过']:
+        print(f"{coin_name} 是{detail}，跳过")
+    if summary['失败']:
+        with open(failed_merge_log, 'a') as f:
+            for coin_name, _, detail, _ in summary['失败']:
+                f.write(f'{coin_name}: {detail}\n')
+        print(f"合并失败的币种已记录至 {failed_merge_log}")
+    quality_failures = [r for r in results if r[3]]
+    if quality_failures:
+        with open(failed_quality_log, 'a') as f:
+            for coin_name, _, _, quality_error in quality_failures:
+                f.write(f'{coin_name}: {quality_error}\n')
+        print(f"{len(quality_failures)}个币种的K线已更新，但质量索引合并失败，已记录至 {failed_quality_log}")
+    end_dates = [r[2] for r in summary['更新'] + summary['新增']]
+    if end_dates:
+        print(f"所有{mode}数据已更新至{max(pd.to_datetime(end_dates))}")
+    return results
+
+
+if __name__ == '__main__':
+    # 默认值
+    target = 'spot'
+
+    # 检查是否有足够的命令行参数
+    if len(sys.argv) > 1:
+        target = sys.argv[1]
+
+    main(target)
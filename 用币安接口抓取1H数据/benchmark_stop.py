@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import argparse
+import importlib
+import time
+from itertools import product
+import numpy as np
+import pandas as pd
+
+'''
+止盈止损计算的一致性校验与性能基准
+
+    python benchmark_stop.py          # 随机校验 + 计时
+    python benchmark_stop.py --quick  # 只做少量校验和小规模计时
+
+先用手工构造、写明期望结果的K线校验每个实现(包括iterrows)，再以逐行实现为基准，
+校验其他实现在随机生成的小时K线上结果逐位一致，需要保持的语义：
+1. 每行看未来24根小时K线的 high/low，外加 index+24 的 avg_price_1m 共25个价格
+2. 止盈为 目标价 < 价格，止损为 目标价 > 价格，相等不触发
+3. 没有触发时触发位置为inf，止盈止损都没触发为0
+4. 止盈止损在同一根K线上触发为2
+'''
+clean = importlib.import_module('2_release_zip_and_clean_data')
+
+# 参与校验和计时的实现，第一个为基准
+engines = {
+    'iterrows': clean.process_single_combination,
+    'numpy': clean.process_single_combination_numpy,
+}
+
+
+def make_hourly_df(n, rng, tick=None, nan_ratio=0.0, avg_outside_band=False):
+    """
+    生成随机小时K线
+    :param tick: 价格最小变动单位，设置后价格会取整到tick，用来制造目标价与价格相等的情况
+    :param nan_ratio: 随机置为NaN的价格比例
+    :param avg_outside_band: avg_price_1m 取在当根K线的high/low之外，使 index+24 的 avg_price_1m 经常成为触发价格
+    """
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = np.concatenate([[100], close[:-1]])
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    avg_price_1m = open_ * (1 + rng.normal(0, 0.002, n))
+    if avg_outside_band:
+        above = rng.random(n) < 0.5
+        avg_price_1m = np.where(above, high * (1 + np.abs(rng.normal(0, 0.05, n))),
+                                low * (1 - np.abs(rng.normal(0, 0.05, n))))
+    df = pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'avg_price_1m': avg_price_1m})
+    if tick:
+        df = (df / tick).round() * tick
+    for column in ['high', 'low', 'avg_price_1m']:
+        df.loc[rng.random(n) < nan_ratio, column] = np.nan
+    return df
+
+
+def flat_df(n=30):
+    """
+    high=101、low=99、avg_price_1m=100 的平稳K线，手工用例在此基础上修改个别价格
+    """
+    return pd.DataFrame({'open': 100.0, 'high': 101.0, 'low': 99.0, 'close': 100.0, 'avg_price_1m': 100.0},
+                        index=range(n))
+
+
+def known_cases():
+    """
+    手工构造的用例：(名称, K线, 止盈, 止损, 每行期望的stop值)
+    """
+    cases = []
+
+    # 只能由 index+24 的 avg_price_1m 触发：第0行的24根high/low都不触发，第25个价格120触发止盈
+    # 第24行自身的 avg_price_1m 为120，止损价108高于low，当根止损
+    df = flat_df()
+    df.loc[24, 'avg_price_1m'] = 120.0
+    expected = np.zeros(30, dtype=np.int64)
+    expected[0], expected[24] = 1, -1
+    cases.append(('index+24的avg_price_1m触发止盈', df, 0.1, -0.1, expected))
+
+    df = flat_df()
+    df.loc[24, 'avg_price_1m'] = 80.0
+    expected = np.zeros(30, dtype=np.int64)
+    expected[0], expected[24] = -1, 1
+    cases.append(('index+24的avg_price_1m触发止损', df, 0.1, -0.1, expected))
+
+    # 目标价与最高价、最低价恰好相等(100*1.5=150, 100*0.5=50，浮点数精确)，不触发
+    df = flat_df()
+    df['high'], df['low'] = 150.0, 50.0
+    cases.append(('目标价等于high/low不触发', df, 0.5, -0.5, np.zeros(30, dtype=np.int64)))
+
+    # 第27行的high触发第4~27行的止盈；第0~3行看不到它，第28、29行的窗口被数据末尾截断，都为inf即0
+    df = flat_df()
+    df.loc[27, 'high'] = 200.0
+    expected = np.zeros(30, dtype=np.int64)
+    expected[4:28] = 1
+    cases.append(('末尾附近没有触发为0', df, 0.5, -0.5, expected))
+
+    # 同一根K线同时突破止盈价和止损价为2
+    df = flat_df()
+    df.loc[3, 'high'], df.loc[3, 'low'] = 200.0, 10.0
+    expected = np.zeros(30, dtype=np.int64)
+    expected[:4] = 2
+    cases.append(('同一根K线同时触发为2', df, 0.5, -0.5, expected))
+
+    # 止损在第2行、止盈在第4行：第0~2行止损先触发，第3、4行只剩止盈
+    df = flat_df()
+    df.loc[2, 'low'], df.loc[4, 'high'] = 10.0, 200.0
+    expected = np.zeros(30, dtype=np.int64)
+    expected[:3], expected[3:5] = -1, 1
+    cases.append(('先后触发取先触发的一方', df, 0.5, -0.5, expected))
+
+    return cases
+
+
+def check_known_cases():
+    """
+    手工用例逐个校验每个实现的结果、类型和列名
+    """
+    for case_name, df, stop_profit, stop_loss, expected in known_cases():
+        for name, engine in engines.items():
+            result = engine(df, stop_profit, stop_loss)
+            if not (np.array_equal(result.to_numpy(), expected) and result.dtype == np.int64
+                    and result.name == f'stop[{stop_profit}_{stop_loss}]'):
+                raise AssertionError(f'{name} 未通过手工用例 {case_name}: 期望 {expected.tolist()}, '
+                                     f'实际 {result.tolist()} ({result.dtype})')
+    print(f'手工用例校验通过: {len(known_cases())} 个用例, 实现: {", ".join(engines)}')
+
+
+def random_grid(rng, size):
+    stop_profit_list = sorted(set(rng.choice([0, 0.01, 0.02, 0.05, 0.1, 0.3, 100], size)))
+    stop_loss_list = sorted(set(rng.choice([0, -0.01, -0.02, -0.05, -0.1, -0.3, -1], size)))
+    return stop_profit_list, stop_loss_list
+
+
+def check_consistency(cases, rng):
+    """
+    随机生成K线和止盈止损网格，校验各实现结果逐位一致
+    """
+    for case in range(cases):
+        # 覆盖不足24根、刚好24/25根以及较长的序列
+        n = int(rng.choice([1, 2, 23, 24, 25, 26, 49, int(rng.integers(1, 400))]))
+        df = make_hourly_df(n, rng, tick=rng.choice([None, 0.01, 1]), nan_ratio=rng.choice([0, 0.05]),
+                            avg_outside_band=rng.random() < 0.5)
+        stop_profit_list, stop_loss_list = random_grid(rng, 3)
+        for stop_profit, stop_loss in product(stop_profit_list, stop_loss_list):
+            expected = engines['iterrows'](df, stop_profit, stop_loss)
+            for name, engine in engines.items():
+                result = engine(df, stop_profit, stop_loss)
+                if not (result.equals(expected) and result.name == expected.name and result.dtype == expected.dtype):
+                    diff = (result != expected).to_numpy().nonzero()[0]
+                    raise AssertionError(f'{name} 与 iterrows 结果不一致: case={case}, n={n}, '
+                                         f'stop[{stop_profit}_{stop_loss}], 不一致的行: {diff[:10]}')
+    print(f'一致性校验通过: {cases} 组随机K线, 实现: {", ".join(engines)}')
+
+
+def run_benchmark(lengths, grid_sizes, rng):
+    """
+    对 process_stop 计时，iterrows 为基准计算加速比
+    """
+    clean.calc_stop = True
+    for n, grid_size in product(lengths, grid_sizes):
+        df = make_hourly_df(n, rng)
+        stop_profit_list = list(np.round(np.linspace(0.01, 0.5, grid_size), 4))
+        stop_loss_list = list(np.round(np.linspace(-0.01, -0.5, grid_size), 4))
+        timings = {}
+        results = {}
+        for name in engines:
+            start = time.perf_counter()
+            results[name] = clean.process_stop(df, stop_loss_list, stop_profit_list, engine=name)
+            timings[name] = time.perf_counter() - start
+        for name in engines:
+            assert results[name].equals(results['iterrows']), f'{name} 的 process_stop 结果与 iterrows 不一致'
+        speedups = ', '.join(f'{name} {timings[name]:.3f}s (x{timings["iterrows"] / timings[name]:.1f})' for name in engines)
+        print(f'{n}根K线, {grid_size}x{grid_size}组止盈止损: {speedups}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='止盈止损计算的一致性校验与性能基准')
+    parser.add_argument('--quick', action='store_true', help='只做少量校验和小规模计时')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    check_known_cases()
+    check_consistency(20 if args.quick else 200, rng)
+    if args.quick:
+        run_benchmark([500], [2], rng)
+    else:
+        run_benchmark([1000, 5000, 20000], [2, 4, 8], rng)
@@ -2,6 +2,7 @@ import os
 
 main_path = r'D:/!Joe/Crpto/history_candle_data'
 下载线程数 = 32
+合并进程数 = max(os.cpu_count() - 1, 1)  # 合并至K线数据库时的并行进程数，设为1则逐个币种依次合并
 debug_mode = False  # 调试模式，开启后仅下载前五个交易对，用于调试
 interval = '1m'  # 下载K线的周期,请勿修改此参数，因为要计算avg_price_1m，最终得到的K线数据是1H的
 
@@ -13,9 +14,12 @@ proxies = {
 calc_stop = True  # 是否计算止盈止损触发状态列，True为计算，False为不计算
 stop_profit_list = [0.02, 0.05, 0.08, 0.1, 0.12, 0.15, 0.3, 100]
 stop_loss_list = [-0.02, -0.05, -0.08, -0.1, -0.12, -0.15, -0.3, -1]
+stop_engine = 'numpy'  # 止盈止损计算方式，'numpy'为向量化计算，'iterrows'为逐行计算，两者结果一致，可用 benchmark_stop.py 校验
 
 # 以下参数无需修改
 现货临时下载文件夹 = os.path.join(main_path, 'Download', 'spot')
 永续合约临时下载文件夹 = os.path.join(main_path, 'Download', 'swap')
 现货K线存放路径 = os.path.join(main_path, 'spot_binance_1h')
 永续合约K线存放路径 = os.path.join(main_path, 'swap_binance_1h')
+现货质量索引路径 = os.path.join(main_path, 'spot_binance_1h_quality')
+永续合约质量索引路径 = os.path.join(main_path, 'swap_binance_1h_quality')
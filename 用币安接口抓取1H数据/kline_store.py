@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import tempfile
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+from config import *
+
+'''
+1H K线数据库的读取接口
+
+    from kline_store import load
+    df = load('BTC-USDT', '2024-01-01', '2024-02-01', ['close', 'quote_volume'])
+
+每个币种的CSV旁边保存一份稀疏索引(.idx)，每隔 index_step 行记录该行的字节偏移和 candle_begin_time，
+按时间区间读取时只解析覆盖该区间的那一段文件。CSV更新后索引会在下次读取时自动重建。
+pandas 在需要时才导入，run.py 可以只用 latest_candle_time 做水位线检查而不加载pandas。
+'''
+index_step = 500  # 稀疏索引每隔多少行记录一次
+cache_size = 64  # 查询结果LRU缓存的条数
+time_format = '%Y-%m-%d %H:%M:%S'
+
+
+def coin_csv_path(symbol, target='spot'):
+    """
+    BTC-USDT 或 BTCUSDT 对应的K线文件路径
+    """
+    if '-' not in symbol:
+        symbol = symbol.replace('USDT', '-USDT')
+    data_directory = 现货K线存放路径 if target == 'spot' else 永续合约K线存放路径
+    return os.path.join(data_directory, symbol + '.csv')
+
+
+def build_sparse_index(csv_path):
+    """
+    扫描一遍K线文件，每隔 index_step 行记录该行的字节偏移和 candle_begin_time
+    """
+    stat = os.stat(csv_path)
+    offsets, times = [], []
+    with open(csv_path, 'rb') as f:
+        f.readline()  # 第一行是说明文字
+        header = f.readline()
+        time_column = header.decode('gbk').strip().split(',').index('candle_begin_time')
+        offset = f.tell()
+        for row, line in enumerate(f):
+            if row % index_step == 0:
+                offsets.append(offset)
+                times.append(line.decode('gbk').split(',')[time_column])
+            offset += len(line)
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'header': header.decode('gbk'),
+        'offsets': offsets,
+        'times': times,
+        'end_offset': offset,
+    }
+
+
+def get_sparse_index(csv_path):
+    """
+    读取K线文件的稀疏索引，索引不存在或CSV已更新时重建并保存
+    .idx 文件只是缓存：读不到或写不了(如只读的K线库)时直接使用内存中重建的索引
+    """
+    index_path = csv_path + '.idx'
+    stat = os.stat(csv_path)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index['mtime_ns'] == stat.st_mtime_ns and index['size'] == stat.st_size:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_sparse_index(csv_path)
+    save_sparse_index(index, index_path, stat.st_mode & 0o777)
+    return index
+
+
+def save_sparse_index(index, index_path, mode):
+    """
+    先写临时文件再替换，其他进程不会读到写了一半的索引；权限与K线文件一致，写入失败时忽略
+    """
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def latest_candle_time(csv_path):
+    """
+    K线文件中最新一根K线的时间，只读列名行和文件末尾，文件不存在或没有数据时返回None
+    """
+    if not os.path.exists(csv_path):
+        return None
+    with open(csv_path, 'rb') as f:
+        f.readline()  # 第一行是说明文字
+        header = f.readline().decode('gbk').strip().split(',')
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        lines = f.read().splitlines()
+    try:
+        return datetime.strptime(lines[-1].decode('gbk').split(',')[header.index('candle_begin_time')], time_format)
+    except (IndexError, ValueError):
+        return None
+
+
+def _to_time_str(value):
+    import pandas as pd
+    return None if value is None else pd.Timestamp(value).strftime(time_format)
+
+
+@lru_cache(maxsize=cache_size)
+def _load_range(csv_path, mtime_ns, size, start, end, columns):
+    """
+    读取 [start, end) 区间的K线，mtime_ns 和 size 作为缓存键的一部分，文件更新后旧缓存自然失效
+    """
+    import pandas as pd
+    index = get_sparse_index(csv_path)
+    times = index['times']
+    # 找到覆盖区间的索引块，只读取这一段字节
+    first_block = max(bisect_right(times, start) - 1, 0) if start else 0
+    # 至少读取一个块，区间内没有数据时返回的空表也保留各列的类型
+    last_block = max(bisect_left(times, end), first_block + 1) if end else len(times)
+    begin = index['offsets'][first_block] if times else index['end_offset']
+    stop = index['offsets'][last_block] if last_block < len(times) else index['end_offset']
+    with open(csv_path, 'rb') as f:
+        f.seek(begin)
+        chunk = f.read(stop - begin)
+
+    usecols = None if columns is None else ['candle_begin_time', *columns]
+    df = pd.read_csv(io.BytesIO(index['header'].encode('gbk') + chunk), encoding='gbk', usecols=usecols)
+    df['candle_begin_time'] = pd.to_datetime(df['candle_begin_time'])
+    if start:
+        df = df[df['candle_begin_time'] >= pd.Timestamp(start)]
+    if end:
+        df = df[df['candle_begin_time'] < pd.Timestamp(end)]
+    if columns is not None:
+        df = df[usecols]
+    return df.reset_index(drop=True)
+
+
+def load(symbols, start=None, end=None, columns=None, target='spot'):
+    """
+    按币种、时间区间和列读取1H K线
+    :param symbols: 币种名称或列表，如 'BTC-USDT'、['BTC-USDT', 'ETH-USDT']
+    :param start: 起始时间(包含)，None表示从头读取
+    :param end: 截止时间(不包含)，None表示读到最新
+    :param columns: 需要的列，candle_begin_time 总会返回，None表示全部列
+    :param target: 'spot' 或 'swap'
+    :return: 多个币种时纵向拼接，并用 symbol 列区分
+    """
+    import pandas as pd
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    columns = None if columns is None else tuple(c for c in columns if c not in ('candle_begin_time', 'symbol'))
+    frames = []
+    for symbol in symbols:
+        csv_path = coin_csv_path(symbol, target)
+        stat = os.stat(csv_path)
+        # 缓存中的DataFrame是共享的，返回副本以免调用方修改后污染缓存
+        df = _load_range(csv_path, stat.st_mtime_ns, stat.st_size, _to_time_str(start), _to_time_str(end), columns).copy()
+        if 'symbol' not in df:
+            df.insert(1, 'symbol', os.path.basename(csv_path)[:-len('.csv')])
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
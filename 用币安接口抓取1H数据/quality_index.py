@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import os
+import pandas as pd
+
+# 每个币种一份数据质量索引，每行记录一个时间区间内的一项指标：
+# filled_minutes  该小时内由向前填充补出来的分钟数
+# duplicates      该小时内被 drop_duplicates 去掉的重复分钟数
+# missing_file    该区间对应的zip文件在币安上不存在
+# checksum_retry  该区间对应的zip文件校验失败后的重试次数
+quality_columns = ['range_start', 'range_end', 'item', 'value']
+
+
+def quality_rows(range_starts, range_ends, item, values):
+    """
+    生成质量索引记录
+    """
+    return pd.DataFrame({
+        'range_start': pd.to_datetime(range_starts),
+        'range_end': pd.to_datetime(range_ends),
+        'item': item,
+        'value': values,
+    }, columns=quality_columns).astype({'value': 'int64'})
+
+
+def read_quality_index(csv_path):
+    if not os.path.exists(csv_path):
+        return quality_rows([], [], [], [])
+    return pd.read_csv(csv_path, parse_dates=['range_start', 'range_end'])
+
+
+def update_quality_index(csv_path, rows, replace_items=(), span=None):
+    """
+    将记录写入质量索引文件
+    :param replace_items: 写入前先删除这些指标的旧记录，任务中断后重跑不会重复记录
+    :param span: (起点, 终点)，只保留与该时间区间重叠的记录
+    """
+    index_df = read_quality_index(csv_path)
+    index_df = index_df[~index_df['item'].isin(replace_items)]
+    index_df = pd.concat([index_df, rows], ignore_index=True)
+    if span is not None:
+        index_df = index_df[(index_df['range_end'] > span[0]) & (index_df['range_start'] < span[1])]
+    index_df.sort_values(['range_start', 'item'], inplace=True)
+    index_df.to_csv(csv_path, index=False)
@@ -1,32 +1,80 @@
 # -*- coding: utf-8 -*-
-import subprocess
-from config import *
+import argparse
+import importlib
 import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from glob import glob
+from config import *
+from kline_store import latest_candle_time
 
 '''
 接口来源：币安
 官方接口github：https://github.com/binance/binance-public-data
 数据来源：https://data.binance.vision
+
+用法：python run.py [all|download|clean|merge] [--target swap spot] [--force]
+各步骤的脚本只在确实有任务时才导入，pandas等依赖不会在无事可做时加载
 '''
 要下载的数据类型 = ['swap', 'spot']  # 'swap',#'spot'
 
-scripts = [
-    ('1_get_binance_data_zip.py', True),  # 需要模式参数
-    ('2_release_zip_and_clean_data.py', True),  # 不需要模式参数
-    ('3_merge_to_orginal_csv.py', True)  # 需要模式参数
-]
-
-for mode in 要下载的数据类型:
-    if mode == 'spot':
-        os.makedirs(现货K线存放路径, exist_ok=True)
-        os.makedirs(现货临时下载文件夹, exist_ok=True)
-    elif mode == 'swap':
-        os.makedirs(永续合约K线存放路径, exist_ok=True)
-        os.makedirs(永续合约临时下载文件夹, exist_ok=True)
-    for script in scripts:
-        subprocess.run(['python', script[0], mode])
-
-# 可以在脚本运行结束后删除临时下载文件夹
-temp_folder = os.path.dirname(现货临时下载文件夹)
-shutil.rmtree(temp_folder)
-print(f"下载临时文件夹 {temp_folder}已被删除")
+# 步骤名称对应的脚本模块，每个模块提供 main(target)
+stage_modules = {
+    'download': '1_get_binance_data_zip',
+    'clean': '2_release_zip_and_clean_data',
+    'merge': '3_merge_to_orginal_csv',
+}
+
+
+def has_work(stage, target):
+    """
+    判断某个步骤是否有任务，只做文件检查
+    """
+    download_directory = 现货临时下载文件夹 if target == 'spot' else 永续合约临时下载文件夹
+    if stage == 'download':
+        # 币安按UTC日发布日度文件，K线库已包含昨天23点的K线时没有新数据可下载
+        data_directory = 现货K线存放路径 if target == 'spot' else 永续合约K线存放路径
+        watermark = latest_candle_time(os.path.join(data_directory, 'ZEN-USDT.csv'))
+        today = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        return watermark is None or watermark < today - timedelta(hours=1)
+    if stage == 'clean':
+        return len(glob(os.path.join(download_directory, '*.zip'))) > 0
+    if stage == 'merge':
+        return len(glob(os.path.join(download_directory, '*_merge*.csv'))) > 0
+
+
+def run_stage(stage, target, force=False):
+    if not force and not has_work(stage, target):
+        print(f'{target} {stage}: 无需更新，跳过')
+        return
+    start = time.perf_counter()
+    importlib.import_module(stage_modules[stage]).main(target)
+    print(f'{target} {stage}: 完成，耗时 {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    parser = argparse.ArgumentParser(description='币安1H K线数据下载、清洗、合并')
+    parser.add_argument('stage', nargs='?', default='all', choices=['all', *stage_modules])
+    parser.add_argument('--target', nargs='+', default=要下载的数据类型, choices=['spot', 'swap'])
+    parser.add_argument('--force', action='store_true', help='跳过水位线检查，强制执行')
+    args = parser.parse_args()
+
+    for mode in args.target:
+        if mode == 'spot':
+            os.makedirs(现货K线存放路径, exist_ok=True)
+            os.makedirs(现货临时下载文件夹, exist_ok=True)
+            os.makedirs(现货质量索引路径, exist_ok=True)
+        elif mode == 'swap':
+            os.makedirs(永续合约K线存放路径, exist_ok=True)
+            os.makedirs(永续合约临时下载文件夹, exist_ok=True)
+            os.makedirs(永续合约质量索引路径, exist_ok=True)
+        for stage in (stage_modules if args.stage == 'all' else [args.stage]):
+            run_stage(stage, mode, args.force)
+
+    # 可以在脚本运行结束后删除临时下载文件夹
+    if args.stage == 'all':
+        temp_folder = os.path.dirname(现货临时下载文件夹)
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        print(f"下载临时文件夹 {temp_folder}已被删除")
+    print(f'总耗时 {time.perf_counter() - start_time:.2f}s')